@@ -1,12 +1,15 @@
 import csv
 import json
-from datetime import datetime
+import time
+from concurrent.futures import ThreadPoolExecutor
+from operator import itemgetter
 from pathlib import Path
-from typing import Literal, Self, TypedDict
+from typing import Iterator, Literal, Self, TypedDict
 
-import requests
-from bs4 import BeautifulSoup
-from dateutil import parser
+import certifi
+import urllib3
+from lxml import etree
+from urllib3.util.retry import Retry
 
 __all__ = (
     "AfadEarthquakeScraper",
@@ -27,21 +30,87 @@ class EarthquakeRecord(TypedDict):
     region: str
 
 
+# The column order, taken from the record definition.
+_COLUMNS: tuple[str, ...] = tuple(EarthquakeRecord.__annotations__)
+_DATETIME_INDEX: int = _COLUMNS.index("datetime")
+
+
 class AfadEarthquakeScraper:
     """
     Scrapes the last 100 earthquakes from AFAD's website.
     """
 
-    def __init__(self, url: str = None):
+    # Compiled once, evaluated against every <tr> the parser closes.
+    # Matches "content-table" as one of the table's classes, like a CSS selector.
+    _IS_TABLE_ROW = etree.XPath(
+        "boolean(parent::tbody/parent::table"
+        '[contains(concat(" ", normalize-space(@class), " "), " content-table ")])'
+    )
+    _ROW_CELLS = etree.XPath("td")
+
+    def __init__(self, url: str = None, http: urllib3.PoolManager = None):
         self._url: str = url or "https://deprem.afad.gov.tr/last-earthquakes.html"
-        self._session: requests.Session = requests.Session()
-        self._data: list[EarthquakeRecord] | None = None
+        self._http: urllib3.PoolManager = http or self._build_http()
+        # The scraped table is stored column-wise, the records are only built
+        # when the results are requested.
+        self._columns: dict[str, list[str]] | None = None
+        self._etag: str | None = None
+        self._last_modified: str | None = None
+        self._created_dirs: set[Path] = set()
+
+    @staticmethod
+    def _build_http(maxsize: int = 2) -> urllib3.PoolManager:
+        return urllib3.PoolManager(
+            maxsize=maxsize,
+            headers={
+                "Accept-Encoding": "gzip, deflate",
+                "User-Agent": "afad-scraper/1.0",
+            },
+            retries=Retry(
+                total=3,
+                backoff_factor=0.3,
+                status_forcelist=(429, 500, 502, 503, 504),
+                # Let _get_html_table() report the final status code.
+                raise_on_status=False,
+            ),
+            cert_reqs="CERT_REQUIRED",
+            ca_certs=certifi.where(),
+        )
+
+    @classmethod
+    def scrape_many(cls, urls: list[str]) -> list[list[EarthquakeRecord]]:
+        """
+        Scrape several pages concurrently over one shared connection pool.
+
+        Args:
+            urls (list[str]): The URLs of the pages to scrape.
+
+        Raises:
+            ValueError: if the table was not found on one of the pages.
+            urllib3.exceptions.HTTPError: if one of the pages returned a
+                non-success status code.
+
+        Returns:
+            list[list[EarthquakeRecord]]: the earthquake records of each page,
+                in the same order as the URLs.
+        """
+        if not urls:
+            return []
+
+        http = cls._build_http(maxsize=len(urls))
+        scrapers = [cls(url, http=http) for url in urls]
+        with ThreadPoolExecutor(max_workers=min(8, len(urls))) as executor:
+            tables = executor.map(cls.scrape_table, scrapers)
+            return [table.results for table in tables]
 
     @property
     def results(self) -> list[EarthquakeRecord] | list:
         """
         Get the earthquake records.
 
+        A new list is built on every access, changing it does not affect
+        the scraped data used by length and the export methods.
+
         Raises:
             ValueError: if the scrape_table() method was not called.
 
@@ -49,9 +118,7 @@ class AfadEarthquakeScraper:
             list[EarthquakeRecord] | list: the earthquake records as a list of
                 dicts or an empty list if no data was found.
         """
-        if self._data is None:
-            raise ValueError("No data found. Run scrape_table() first.")
-        return self._data
+        return [dict(zip(_COLUMNS, row)) for row in self._rows()]
 
     @property
     def length(self) -> int:
@@ -64,79 +131,160 @@ class AfadEarthquakeScraper:
         Returns:
             int: the number of the scraped earthquake records as an integer.
         """
-        return len(self.results)
+        return len(self._table["id"])
 
-    def _get_html_table(self) -> bytes:
-        response: requests.Response = self._session.get(self._url)
-        if not response.ok:
-            raise requests.HTTPError(
-                f"Non-success status code returned: {response.status_code}"
+    @property
+    def _table(self) -> dict[str, list[str]]:
+        if self._columns is None:
+            raise ValueError("No data found. Run scrape_table() first.")
+        return self._columns
+
+    def _rows(self) -> Iterator[tuple[str, ...]]:
+        return zip(*self._table.values())
+
+    def _get_html_table(
+        self,
+    ) -> tuple[urllib3.HTTPResponse, str | None, str | None] | None:
+        # Request headers replace the pool defaults instead of extending them.
+        headers = dict(self._http.headers)
+        # Only revalidate when there are parsed records to fall back on.
+        if self._columns is not None:
+            if self._etag:
+                headers["If-None-Match"] = self._etag
+            if self._last_modified:
+                headers["If-Modified-Since"] = self._last_modified
+
+        response: urllib3.HTTPResponse = self._http.request(
+            "GET", self._url, headers=headers, preload_content=False
+        )
+        if response.status == 304:
+            response.drain_conn()
+            response.release_conn()
+            return None
+        if response.status >= 400:
+            # Read the error body too so the connection can be reused.
+            response.drain_conn()
+            response.release_conn()
+            raise urllib3.exceptions.HTTPError(
+                f"Non-success status code returned: {response.status}"
                 "\nCheck the URL or file a bug."
             )
-        return response.content
 
-    def _get_soup(self, html: str | bytes) -> BeautifulSoup:
-        return BeautifulSoup(html, "html.parser")
+        # The validators are only stored by the caller once the page was
+        # parsed, a failed parse must not be mistaken for a cached one.
+        return (
+            response,
+            response.headers.get("ETag"),
+            response.headers.get("Last-Modified"),
+        )
+
+    def _read_rows(self, parser: etree.HTMLPullParser) -> Iterator[tuple[str, ...]]:
+        for _, row in parser.read_events():
+            if not self._IS_TABLE_ROW(row):
+                continue
+
+            # itertext() rather than td.text so that nested markup in a cell
+            # is kept, and empty cells still take up their column.
+            cells = ["".join(td.itertext()) for td in self._ROW_CELLS(row)]
+            yield self._build_row(cells)
+            # The row is no longer needed, free it and the rows before it
+            # so that the table body does not grow while the rest is parsed.
+            row.clear()
+            tbody = row.getparent()
+            while row.getprevious() is not None:
+                del tbody[0]
+
+    @staticmethod
+    def _build_row(cells: list[str]) -> tuple[str, ...]:
+        # TODO: Refactor the mappings, reading the values dynamically
+        #  from the table headers in some way.
+        date_time, latitude, longitude, depth, type, magnitude, region, *_, id = cells
+        # AFAD serves timestamps as "YYYY-MM-DD HH:MM:SS", which is
+        # already ISO 8601 apart from the separator.
+        date_part, time_part = date_time.strip().split(" ", 1)
+        # In the same order as _COLUMNS.
+        return (
+            id,
+            f"{date_part}T{time_part}",
+            date_part,
+            time_part,
+            latitude,
+            longitude,
+            depth,
+            type,
+            magnitude,
+            region,
+        )
 
     def _prepare_file_path(self, file_type: str, file_name: str, directory: str) -> str:
-        file_path = ""
-        if directory:
-            file_path += directory + "/" if not directory.endswith("/") else directory
-
+        dir_path = Path(directory) if directory else Path(".")
+        if dir_path not in self._created_dirs:
             # Create the directory if it doesn't exist
-            Path(file_path).mkdir(parents=True, exist_ok=True)
+            dir_path.mkdir(parents=True, exist_ok=True)
+            self._created_dirs.add(dir_path)
 
-        if file_name:
-            file_path += (
-                file_name
-                if file_name.endswith(f".{file_type}")
-                else file_name + f".{file_type}"
-            )
-        else:
-            file_path += (
-                f"afad-earthquakes-export-{datetime.now().isoformat()}.{file_type}"
-            )
+        # No colons in the timestamp, they are not allowed in Windows file names.
+        name = file_name or f"afad-earthquakes-export-{time.strftime('%Y%m%dT%H%M%S')}"
+        if not name.endswith(f".{file_type}"):
+            name += f".{file_type}"
 
-        return file_path
+        return str(dir_path / name)
 
     def scrape_table(self) -> Self:
         """
         Get table values from AFAD's website as a list of records (dicts).
 
+        Repeated calls send a conditional request and keep the current
+        records if the page was not modified since the last scrape.
+
         Raises:
             ValueError: if the table was not found because of a change
                 in the website. or if the table data is empty.
+            urllib3.exceptions.HTTPError: if the page returned a non-success
+                status code.
 
         Returns:
             list[EarthquakeRecord]: a list of 100 earthquake records.
         """
-        soup = self._get_soup(self._get_html_table())
-        table = soup.find("table", {"class": "content-table"})
-        if not table:
+        fetched = self._get_html_table()
+        if fetched is None:
+            # Not modified since the last scrape, keep the current records.
+            return self
+        response, etag, last_modified = fetched
+
+        # Parse the rows as they arrive instead of loading the whole page.
+        parser = etree.HTMLPullParser(events=("end",), tag="tr", encoding="utf-8")
+        rows: list[tuple[str, ...]] = []
+        try:
+            for chunk in response.stream(1 << 14):
+                parser.feed(chunk)
+                rows.extend(self._read_rows(parser))
+            parser.close()
+            rows.extend(self._read_rows(parser))
+        except etree.LxmlError as e:
+            # e.g. an empty body, which lxml refuses to parse at all.
+            raise ValueError(
+                "Data table was not found. Check the URL or file a bug."
+            ) from e
+        finally:
+            # Read whatever is left so the connection can be reused.
+            response.drain_conn()
+            response.release_conn()
+
+        if not rows:
             raise ValueError("Data table was not found. Check the URL or file a bug.")
 
-        self._data = []
-        for tr in table.tbody.find_all("tr"):
-            tds = tr.find_all("td")
-            date_time = parser.parse(tds[0].text)
-            self._data.append(
-                # TODO: Refactor the mappings, reading the values dynamically
-                #  from the table headers in some way.
-                {
-                    "id": tds[-1].text,
-                    "datetime": date_time.isoformat(),
-                    "date": date_time.date().isoformat(),
-                    "time": str(date_time.time()),
-                    "latitude": tds[1].text,
-                    "longitude": tds[2].text,
-                    "depth": tds[3].text,
-                    "type": tds[4].text,
-                    "magnitude": tds[5].text,
-                    "region": tds[6].text,
-                }
-            )
-
-        self._data.sort(key=lambda record: record["datetime"], reverse=True)
+        # AFAD already lists the newest records first, only sort if it didn't.
+        # ISO 8601 datetimes sort correctly as strings.
+        if any(
+            newer[_DATETIME_INDEX] < older[_DATETIME_INDEX]
+            for newer, older in zip(rows, rows[1:])
+        ):
+            rows.sort(key=itemgetter(_DATETIME_INDEX), reverse=True)
+
+        self._columns = dict(zip(_COLUMNS, map(list, zip(*rows))))
+        self._etag = etag
+        self._last_modified = last_modified
         return self
 
     def export_json(
@@ -166,12 +314,15 @@ class AfadEarthquakeScraper:
         if type not in ("file", "string"):
             raise ValueError("type must be either 'file' or 'string'.")
 
+        json_string = json.dumps(
+            self.results, ensure_ascii=False, separators=(",", ":")
+        )
         if type == "string":
-            return json.dumps(self.results, ensure_ascii=False)
+            return json_string
 
         file_path = self._prepare_file_path("json", file_name, directory)
-        with open(file_path, "w") as f:
-            json.dump(self.results, f, ensure_ascii=False)
+        with open(file_path, "wb", buffering=1 << 16) as f:
+            f.write(json_string.encode("utf-8"))
 
         print(f"Exported to {file_path!r}")
 
@@ -188,15 +339,16 @@ class AfadEarthquakeScraper:
         Returns:
             None
         """
-        if not self.results:
+        if not self.length:
             raise ValueError("Cannot export empty data.")
 
         file_path = self._prepare_file_path("csv", file_name, directory)
-        columns = self.results[0].keys()
-        with open(file_path, "w") as f:
-            writer = csv.DictWriter(f, fieldnames=columns)
-            writer.writeheader()
-            writer.writerows(self.results)
+        with open(
+            file_path, "w", encoding="utf-8", newline="", buffering=1 << 16
+        ) as f:
+            writer = csv.writer(f)
+            writer.writerow(_COLUMNS)
+            writer.writerows(self._rows())
 
         print(f"Exported to {file_path!r}")
 